@@ -0,0 +1,564 @@
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CompactCheckpointSaver(BaseCheckpointSaver[str]):
+    """Sqlite checkpoint saver that keeps MessagesState threads compact.
+
+    Channel values are stored once per channel version, so channels that did
+    not change in a superstep are not written again. The messages channel is
+    stored as an append-only message log: each version only references the
+    previous version and the messages appended since, so the bytes written
+    per superstep do not grow with the length of the thread. Every
+    ``snapshot_every`` versions the references to all messages are stored
+    instead, so loading a version follows a bounded chain of deltas.
+
+    Usage:
+        >>> saver = CompactCheckpointSaver(sqlite3.connect("checkpoints.db", check_same_thread=False))
+        >>> graph = builder.compile(checkpointer=saver)
+    """
+    MESSAGES_CHANNEL = "messages"
+    DELTA_TYPE = "messages-delta"
+    ZSTD_SUFFIX = "+zstd"
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        serde: Optional[SerializerProtocol] = None,
+        compress: bool = False,
+        prune_intermediate: bool = False,
+        snapshot_every: int = 50,
+        cache_size: int = 1024,
+    ):
+        """Initialize the saver and create its tables.
+
+        Args:
+            conn: Sqlite connection, shared by all threads using the saver
+            serde: Serializer for checkpoints, channel values and messages
+            compress: Whether to compress stored blobs with zstd
+            prune_intermediate: Whether to delete the intermediate (loop)
+                checkpoints superseded by newer ones
+            snapshot_every: Number of message deltas after which the full list
+                of message references is stored again, bounding load cost
+            cache_size: Number of threads whose last messages version is
+                kept in memory as the base of the next delta
+        """
+        super().__init__(serde=serde)
+        if compress and zstandard is None:
+            raise ImportError(
+                "zstd compression requires the zstandard package: pip install zstandard"
+            )
+        self.conn = conn
+        self.compress = compress
+        self.prune_intermediate = prune_intermediate
+        self.lock = threading.Lock()
+        self.snapshot_every = snapshot_every
+        self.cache_size = cache_size
+        # Last known messages version per (thread_id, checkpoint_ns), used as delta base,
+        # least recently used threads first: (version, message fingerprints,
+        # log sequence numbers, distance from the last snapshot)
+        self._last_messages: OrderedDict[tuple[str, str], tuple[str, list[int], list[int], int]] = OrderedDict()
+        self.setup()
+
+    def setup(self):
+        """Create the tables used by the saver if they do not exist."""
+        with self.lock, self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    source TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS blobs (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    channel TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    blob BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    seq INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    blob BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, seq)
+                );
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    blob BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                """
+            )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get the checkpoint of the config, or the latest one of its thread."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.lock, closing(self.conn.cursor()) as cur:
+            if checkpoint_id := get_checkpoint_id(config):
+                cur.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                cur.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return self._load_tuple(cur, thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints from newest to oldest."""
+        where, params = [], []
+        if config is not None:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata FROM checkpoints"
+        )
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock, closing(self.conn.cursor()) as cur:
+            rows = cur.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                checkpoint_tuple = self._load_tuple(cur, thread_id, checkpoint_ns, row)
+                if filter and not all(
+                    checkpoint_tuple.metadata.get(key) == value
+                    for key, value in filter.items()
+                ):
+                    continue
+                results.append(checkpoint_tuple)
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint, writing only the channel values that changed."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        c = checkpoint.copy()
+        values: dict[str, Any] = c.pop("channel_values")  # type: ignore[misc]
+        metadata = get_checkpoint_metadata(config, metadata)
+        last_messages = None
+
+        with self.lock, self.conn, closing(self.conn.cursor()) as cur:
+            for channel, version in new_versions.items():
+                if channel not in values:
+                    blob = ("empty", None)
+                elif channel == self.MESSAGES_CHANNEL and isinstance(values[channel], list):
+                    blob, fingerprints, seqs, depth = self._dump_messages(
+                        cur, thread_id, checkpoint_ns, values[channel]
+                    )
+                    last_messages = (str(version), fingerprints, seqs, depth)
+                else:
+                    blob = self._dumps(values[channel])
+                cur.execute(
+                    "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, blob) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, channel, str(version), *blob),
+                )
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, "
+                "parent_checkpoint_id, source, type, checkpoint, metadata_type, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    parent_checkpoint_id,
+                    metadata.get("source"),
+                    *self._dumps(c),
+                    *self._dumps(metadata),
+                ),
+            )
+            if self.prune_intermediate:
+                self._prune(cur, thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id)
+
+        # Only a committed version can be the base of the next delta
+        if last_messages is not None:
+            with self.lock:
+                self._cache_last_messages((thread_id, checkpoint_ns), last_messages)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store the intermediate writes of a task."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special writes (errors, interrupts) replace previous ones, others are kept
+        query = (
+            "INSERT OR REPLACE INTO writes "
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else "INSERT OR IGNORE INTO writes "
+        ) + (
+            "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, blob, task_path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        with self.lock, self.conn, closing(self.conn.cursor()) as cur:
+            cur.executemany(
+                query,
+                [
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint_id,
+                        task_id,
+                        WRITES_IDX_MAP.get(channel, idx),
+                        channel,
+                        *self._dumps(value),
+                        task_path,
+                    )
+                    for idx, (channel, value) in enumerate(writes)
+                ],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete all checkpoints, writes and messages of a thread."""
+        with self.lock, self.conn, closing(self.conn.cursor()) as cur:
+            for table in ("checkpoints", "blobs", "messages", "writes"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            for key in [key for key in self._last_messages if key[0] == thread_id]:
+                del self._last_messages[key]
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint_tuple in results:
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
+
+    def _load_tuple(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        """Rebuild a checkpoint tuple from its row, channel blobs and pending writes."""
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint_: Checkpoint = self._loads(type_, checkpoint)
+        cur.execute(
+            "SELECT task_id, channel, type, blob FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        pending_writes = [
+            (task_id, channel, self._loads(value_type, value))
+            for task_id, channel, value_type, value in cur.fetchall()
+        ]
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint_,
+                "channel_values": self._load_blobs(
+                    cur, thread_id, checkpoint_ns, checkpoint_["channel_versions"]
+                ),
+            },
+            metadata=self._loads(metadata_type, metadata),
+            pending_writes=pending_writes,
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+        )
+
+    def _load_blobs(
+        self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str, versions: ChannelVersions
+    ) -> dict[str, Any]:
+        channel_values: dict[str, Any] = {}
+        for channel, version in versions.items():
+            cur.execute(
+                "SELECT type, blob FROM blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            )
+            row = cur.fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            if row[0] == self.DELTA_TYPE:
+                channel_values[channel] = self._load_messages(cur, thread_id, checkpoint_ns, str(version))
+            else:
+                channel_values[channel] = self._loads(*row)
+        return channel_values
+
+    def _dump_messages(
+        self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str, messages: list
+    ) -> tuple[tuple[str, bytes], Sequence[int], Sequence[int], int]:
+        """Append the new messages to the log and build the blob of this version.
+
+        Returns:
+            The blob, the fingerprints and log sequence numbers of all messages
+            of the version and its distance from the last full snapshot
+        """
+        base_version, base, base_seqs, base_depth = self._last_messages.get(
+            (thread_id, checkpoint_ns), (None, [], [], 0)
+        )
+        fingerprints = [self._fingerprint(message) for message in messages]
+        if fingerprints[:len(base)] != base:
+            # Messages were removed or replaced, log them all again
+            base_version, base, base_seqs, base_depth = None, [], [], 0
+
+        cur.execute(
+            "SELECT COALESCE(MAX(seq), -1) FROM messages WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        )
+        next_seq = cur.fetchone()[0] + 1
+        appended = messages[len(base):]
+        seqs = list(range(next_seq, next_seq + len(appended)))
+        cur.executemany(
+            "INSERT INTO messages (thread_id, checkpoint_ns, seq, type, blob) VALUES (?, ?, ?, ?, ?)",
+            [
+                (thread_id, checkpoint_ns, seq, *self._dumps(message))
+                for seq, message in zip(seqs, appended)
+            ],
+        )
+
+        # Every snapshot_every versions the full list of references is written,
+        # so loading a version never follows more than that many deltas
+        all_seqs = base_seqs + seqs
+        depth = base_depth + 1 if base_version is not None else 0
+        if depth >= self.snapshot_every:
+            base_version, seqs, depth = None, all_seqs, 0
+        delta = {"base": base_version, "seqs": seqs, "depth": depth}
+        return (self.DELTA_TYPE, json.dumps(delta).encode()), fingerprints, all_seqs, depth
+
+    def _load_messages(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str, version: str) -> list:
+        """Rebuild the messages of a version by following its delta chain."""
+        cached_version, _, cached_seqs, depth = self._last_messages.get(
+            (thread_id, checkpoint_ns), (None, None, None, None)
+        )
+        seqs: list[int] = []
+        next_version: Optional[str] = version
+        if cached_version == version:
+            seqs, next_version = list(cached_seqs), None
+        else:
+            depth = None
+        while next_version is not None:
+            cur.execute(
+                "SELECT blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, self.MESSAGES_CHANNEL, next_version),
+            )
+            delta = json.loads(cur.fetchone()[0])
+            if depth is None:
+                depth = delta["depth"]
+            seqs[:0] = delta["seqs"]
+            next_version = delta["base"]
+
+        messages_by_seq = {}
+        if seqs:
+            cur.execute(
+                "SELECT seq, type, blob FROM messages "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND seq BETWEEN ? AND ?",
+                (thread_id, checkpoint_ns, min(seqs), max(seqs)),
+            )
+            messages_by_seq = {seq: (type_, blob) for seq, type_, blob in cur.fetchall()}
+        messages = [self._loads(*messages_by_seq[seq]) for seq in seqs]
+
+        # The newest loaded version is the base the next checkpoint of the thread builds on
+        if cached_version is None or version >= cached_version:
+            self._cache_last_messages(
+                (thread_id, checkpoint_ns),
+                (version, [self._fingerprint(message) for message in messages], seqs, depth),
+            )
+        return messages
+
+    def _cache_last_messages(
+        self, key: tuple[str, str], last_messages: tuple[str, Sequence[int], Sequence[int], int]
+    ):
+        """Remember the last messages version of a thread, evicting the least recently used."""
+        self._last_messages[key] = last_messages
+        self._last_messages.move_to_end(key)
+        while len(self._last_messages) > self.cache_size:
+            self._last_messages.popitem(last=False)
+
+    @staticmethod
+    def _fingerprint(message: Any) -> int:
+        """Hash of a message, it changes when the message is replaced or edited."""
+        return hash(repr(message))
+
+    def _prune(
+        self,
+        cur: sqlite3.Cursor,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+        parent_checkpoint_id: Optional[str],
+    ):
+        """Delete the intermediate checkpoints superseded by the new one.
+
+        The new checkpoint and its parent are kept, as are the input
+        checkpoints that start each turn. Channel blobs and the message log
+        are kept since later versions reference them.
+        """
+        keep = (checkpoint_id, parent_checkpoint_id or checkpoint_id)
+        cur.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ("
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND source = 'loop' AND checkpoint_id NOT IN (?, ?))",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns, *keep),
+        )
+        cur.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND source = 'loop' AND checkpoint_id NOT IN (?, ?)",
+            (thread_id, checkpoint_ns, *keep),
+        )
+        if cur.rowcount:
+            logger.debug(f"Pruned {cur.rowcount} intermediate checkpoints of thread {thread_id}")
+
+    def _dumps(self, value: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if self.compress:
+            return type_ + self.ZSTD_SUFFIX, zstandard.ZstdCompressor().compress(data)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        if type_.endswith(self.ZSTD_SUFFIX):
+            if zstandard is None:
+                raise ImportError(
+                    "Reading zstd compressed checkpoints requires the zstandard package: pip install zstandard"
+                )
+            type_ = type_[:-len(self.ZSTD_SUFFIX)]
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return self.serde.loads_typed((type_, data))
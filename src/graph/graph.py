@@ -1,13 +1,17 @@
+import os
 from typing import Literal
 from langgraph.graph import END, StateGraph, START
 from langgraph.graph.message import MessagesState
+from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.store.base import BaseStore
 from lg_configuration import Configuration
 from llm.model_factory import LLMFactory
+from llm.request_coalescer import CoalescingChatModel, RequestCoalescer
 from instructions.instructions_factory import InstructionsFactory
 from todo.todo_factory import TodoFactory
 from graph.master_agent import MasterAgent
+from graph.speculative_extractor import SpeculativeExtractor
 from user_profile.profile_factory import ProfileFactory
 
 
@@ -17,6 +21,7 @@ def route_message(
     store: BaseStore,
 ) -> Literal[
     END,
+    "task_mAIstro",
     "update_todos",
     "update_instructions",
     "update_profile"
@@ -24,7 +29,10 @@ def route_message(
     """Reflect on the messages to decide which tool to use."""
     message = state['messages'][-1]
 
-    if len(message.tool_calls) == 0:
+    if isinstance(message, ToolMessage):
+        # The update was already committed by speculative extraction
+        result = "task_mAIstro"
+    elif len(message.tool_calls) == 0:
         result = END
     else:
         tool_call = message.tool_calls[0]
@@ -44,13 +52,31 @@ def route_message(
 llm_factory = LLMFactory()
 llm = llm_factory.create("gpt-o4")  # Or whichever model you prefer
 
-# Create master agent
-master_agent = MasterAgent(llm=llm)
+# Extraction requests from every graph run share one coalescer, so bursts
+# are batched and rate limited together. The limit defaults to the
+# tokens per minute of the provider's entry tier.
+extraction_tokens_per_minute = float(os.environ.get("EXTRACTION_TOKENS_PER_MINUTE", 30_000))
+tools_llm = CoalescingChatModel(
+    coalescer=RequestCoalescer(
+        llm,
+        max_batch_size=16,
+        max_wait_ms=5.0,
+        tokens_per_second=extraction_tokens_per_minute / 60,
+        burst_tokens=extraction_tokens_per_minute
+    )
+)
 
 # Create tool instances using individual factories
-update_todos = TodoFactory.create(llm=llm)
-update_profile = ProfileFactory.create(llm=llm)
-update_instructions = InstructionsFactory.create(llm=llm)
+update_todos = TodoFactory.create(llm=tools_llm)
+update_profile = ProfileFactory.create(llm=tools_llm)
+update_instructions = InstructionsFactory.create(llm=tools_llm)
+
+# Create master agent, extraction is only speculated when enabled in the configuration
+speculator = SpeculativeExtractor(
+    tools={"todo": update_todos, "user": update_profile},
+    max_workers=16  # two extractions per turn, extractions still queued count as misses
+)
+master_agent = MasterAgent(llm=llm, speculator=speculator)
 
 
 # Create the graph
@@ -1,10 +1,12 @@
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.store.base import BaseStore
 from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.graph.message import MessagesState
 from lg_configuration import Configuration
 from graph.models import UpdateMemory
+from graph.speculative_extractor import SpeculativeExtractor
+from instructions.rule_store import search_all
 
 
 class MasterAgent:
@@ -51,14 +53,16 @@ class MasterAgent:
 
     5. Respond naturally to user user after a tool call was made to save memories, or if no tool call was made."""
 
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, speculator: SpeculativeExtractor | None = None):
         """Initialize with required dependencies.
 
         Args:
             store: Storage for user memories and data
             model: Language model for generating responses
+            speculator: Optional extractor run concurrently with the model call
         """
         self._model = llm
+        self._speculator = speculator
 
     def run(self, state: MessagesState, config: RunnableConfig, store: BaseStore):
         """Load memories from the store and use them to personalize the chatbot's response."""
@@ -78,6 +82,17 @@ class MasterAgent:
             instructions=instructions
         )
 
+        # Start memory extraction while the model decides whether it is needed.
+        # Only speculate on user turns, the agent rarely updates memory again
+        # right after a tool result.
+        pending = None
+        if (
+            self._speculator is not None
+            and configurable.speculative_extraction
+            and isinstance(state["messages"][-1], HumanMessage)
+        ):
+            pending = self._speculator.start(state["messages"], user_id, store)
+
         # Respond using memory as well as the chat history
         # with binding tools we ask the model to limit to only
         # the tools we want to use
@@ -88,7 +103,13 @@ class MasterAgent:
             [SystemMessage(content=system_msg)] + state["messages"]
         )
 
-        return {"messages": [response]}
+        messages = [response]
+        if pending is not None:
+            tool_message = self._speculator.resolve(pending, response, user_id, store)
+            if tool_message is not None:
+                messages.append(tool_message)
+
+        return {"messages": messages}
 
     def _get_profile_memory(self, user_id: str, store: BaseStore) -> str | None:
         """Get the user profile from storage."""
@@ -108,8 +129,8 @@ class MasterAgent:
     def _get_instructions_memory(self, user_id: str, store: BaseStore) -> str:
         """Get the custom instructions from storage."""
         namespace = ("instructions", user_id)
-        memories = store.search(namespace)
-        result = ""
-        if memories:
-            result = memories[0].value
-        return result
+        memories = search_all(store, namespace)
+        # Instructions saved as free text before they were split into rules
+        # are stored under "memory"
+        rules = (mem.value.get('rule') or mem.value.get('memory') for mem in memories if mem)
+        return "\n".join(f"- {rule}" for rule in rules if rule)
@@ -0,0 +1,124 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Protocol
+from langchain_core.messages import AIMessage, AnyMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langgraph.store.base import BaseStore
+from spies.trustcall_spy import Spy
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ExtractionTool(Protocol):
+    """Memory tool that can extract and save in two separate steps."""
+
+    def extract(self, messages: list, user_id: str, store: BaseStore) -> tuple[dict, Spy]:
+        ...
+
+    def save(self, result: dict, spy: Spy, user_id: str, store: BaseStore) -> str:
+        ...
+
+
+class SpeculativeExtractor:
+    """Runs memory extraction concurrently with the master agent call.
+
+    The extraction is started on the same message window the memory tool
+    would see after the agent asks for an update. If the agent then emits an
+    UpdateMemory call with a matching type, the speculative result is saved
+    and the extractor round-trip is taken off the critical path. Otherwise
+    the result is discarded and its tokens are counted as wasted.
+    """
+
+    def __init__(self, tools: dict[str, ExtractionTool], max_workers: int = 4):
+        """Initialize with the tools to speculate on.
+
+        Args:
+            tools: Memory tools keyed by the UpdateMemory type they handle
+            max_workers: Number of threads running speculative extractions
+        """
+        self._tools = tools
+        # Copies the node context so extractions keep the run's callbacks and tracing
+        self._executor = ContextThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="speculative-extraction"
+        )
+        self._lock = Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.wasted_tokens = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of speculative turns whose result was committed."""
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    def start(self, messages: list[AnyMessage], user_id: str, store: BaseStore) -> dict[str, Future]:
+        """Start one extraction per tool over the given message window."""
+        return {
+            update_type: self._executor.submit(tool.extract, list(messages), user_id, store)
+            for update_type, tool in self._tools.items()
+        }
+
+    def resolve(
+        self,
+        pending: dict[str, Future],
+        response: AIMessage,
+        user_id: str,
+        store: BaseStore,
+    ) -> dict | None:
+        """Commit the speculative extraction matching the agent response.
+
+        Returns:
+            The tool message for the committed update, or None if the
+            agent did not request any of the speculated updates or the
+            matching extraction had not started or failed
+        """
+        update_type = None
+        if response.tool_calls:
+            update_type = response.tool_calls[0]['args']['update_type']
+
+        # Discard the extractions the agent did not ask for, queued ones
+        # are cancelled before they reach the provider
+        for speculated_type, future in pending.items():
+            if speculated_type != update_type and not future.cancel():
+                future.add_done_callback(self._count_wasted)
+
+        result = None
+        future = pending.get(update_type)
+        if future is not None and future.cancel():
+            # Still queued behind other turns, waiting for it would be slower
+            # than running the extraction in the regular update node
+            logger.info(f"Speculative {update_type} extraction had not started")
+        elif future is not None:
+            try:
+                extraction, spy = future.result()
+            except Exception:
+                # The regular update node runs the extraction again
+                logger.exception(f"Speculative {update_type} extraction failed")
+            else:
+                content = self._tools[update_type].save(extraction, spy, user_id, store)
+                result = {
+                    "role": "tool",
+                    "content": content,
+                    "tool_call_id": response.tool_calls[0]['id']  # Need for tool call validation by the agent
+                }
+
+        with self._lock:
+            self.attempts += 1
+            if result is not None:
+                self.hits += 1
+        logger.info(
+            f"Speculative extraction: hit={result is not None}, "
+            f"hit_rate={self.hit_rate:.2f}, wasted_tokens={self.wasted_tokens}"
+        )
+        return result
+
+    def _count_wasted(self, future: Future):
+        """Add the tokens of a discarded extraction to the wasted total."""
+        if (error := future.exception()) is not None:
+            logger.warning(f"Discarded speculative extraction failed: {error!r}")
+            return
+        _, spy = future.result()
+        with self._lock:
+            self.wasted_tokens += spy.total_tokens
@@ -7,13 +7,23 @@ class InstructionsFactory:
     """Factory for creating instruction-related tools."""
 
     @staticmethod
-    def create(llm: BaseChatModel) -> InstructionsTool:
+    def create(
+        llm: BaseChatModel,
+        max_repair_rounds: int = 1,
+        deadline_s: float | None = 30.0,
+    ) -> InstructionsTool:
         """Create an InstructionsTool instance.
 
         Args:
             llm: The language model to use
+            max_repair_rounds: Trustcall repair rounds allowed per extraction
+            deadline_s: Seconds after which an extraction stops starting LLM calls
 
         Returns:
             An instance of InstructionsTool
         """
-        return InstructionsTool(llm=llm)
\ No newline at end of file
+        return InstructionsTool(
+            llm=llm,
+            max_repair_rounds=max_repair_rounds,
+            deadline_s=deadline_s
+        )
\ No newline at end of file
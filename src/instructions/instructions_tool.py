@@ -1,4 +1,5 @@
 from datetime import datetime
+import json
 import uuid
 from langchain_core.language_models.chat_models import (
     BaseChatModel,
@@ -6,32 +7,51 @@ from langchain_core.language_models.chat_models import (
 from langgraph.graph import MessagesState
 from langchain_core.runnables import RunnableConfig
 from langgraph.store.base import BaseStore
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage
 from langchain_core.messages import merge_message_runs
 import trustcall
 from lg_configuration import Configuration
+from instructions.io_models import Instruction
+from instructions.rule_store import search_all
+from spies.trustcall_spy import Spy
+from spies.extraction_budget import DEADLINE_EXCEEDED_MESSAGE, ExtractionBudget
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 class InstructionsTool:
-    """Tool for updating the user's instructions."""
+    """Tool for updating the user's instructions.
+
+    Instructions are stored as a collection of independent rules. Trustcall
+    patches only the rules that change and inserts new ones, so the LLM
+    generates the delta instead of rewriting the whole instruction text.
+    """
     STORE_KEY = "instructions"
-    TOOL_NAME = "Instructions"
+    TOOL_NAME = "Instruction"
     TRUSTCALL_INSTRUCTION = """Reflect on the following interaction.
 
     Based on this interaction, update your instructions for how to update ToDo list items.
 
     Use any feedback from the user to update how they like to have items added, etc.
 
-    Your current instructions are:
-
-    <current_instructions>
-    {current_instructions}
-    </current_instructions>
+    Each instruction is a single rule. Patch an existing rule if the user refines it,
+    insert a new rule for a new preference, remove a rule the user takes back,
+    and leave unrelated rules untouched.
 
     System Time: {time}"""
 
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, max_repair_rounds: int = 1, deadline_s: float | None = 30.0):
+        """Initialize the tool.
+
+        Args:
+            llm: The language model to use
+            max_repair_rounds: Trustcall repair rounds allowed per extraction
+            deadline_s: Seconds after which an extraction stops starting LLM calls
+        """
         self.llm = llm
+        self.max_repair_rounds = max_repair_rounds
+        self.deadline_s = deadline_s
 
     def run_tool(self, state: MessagesState, config: RunnableConfig, store: BaseStore):
         """Reflect on the chat history and update the memory collection."""
@@ -42,48 +62,112 @@ class InstructionsTool:
         # get namespace for instructions
         namespace = (self.STORE_KEY, user_id)
 
-        # Get existing memory
-        existing_items = store.search(namespace)
-        existing_memory = existing_items[0] if existing_items else None
+        # Get existing rules for user and tool, every rule must be visible to be patched or removed
+        existing_values = {}
+        for item in search_all(store, namespace):
+            value = self._migrate_legacy(item.key, item.value, namespace, store)
+            if value is not None:
+                existing_values[item.key] = value
+        existing_memories = (
+            [
+                (key, self.TOOL_NAME, value)
+                for key, value in existing_values.items()
+            ] if existing_values else None
+        )
 
         # Merge the chat history and the instruction
         updated_messages = list(
             merge_message_runs(
                 messages=[
-                    SystemMessage(content=self.get_formatted_instruction(existing_memory))
-                ] + state["messages"][:-1] + [
-                    HumanMessage(content="Please update the instructions based on the conversation")
-                ]
+                    SystemMessage(content=self.get_formatted_instruction())
+                ] + state["messages"][:-1]
             )
         )
 
-        # Get new instructions from LLM
-        new_memory = self.llm.invoke(updated_messages)
-
-        # Update memory with new instructions
-        store_key = "user_instructions"
-        store.put(
-            namespace,
-            store_key,
-            {"memory": new_memory.content}
+        # Initialize the spy for visibility into the tool calls made by Trustcall
+        spy = Spy()
+
+        instructions_extractor = trustcall.create_extractor(
+            self.llm,
+            tools=[Instruction],
+            tool_choice=self.TOOL_NAME,
+            enable_inserts=True,
+            enable_deletes=True
+        ).with_listeners(on_end=spy)
+
+        # Invoke the extractor within the repair budget
+        budget = ExtractionBudget(self.max_repair_rounds, self.deadline_s)
+        result = budget.invoke(
+            instructions_extractor,
+            {
+                "messages": updated_messages,
+                "existing": existing_memories
+            },
+            self.TOOL_NAME
         )
 
+        # Process the results
+        for r, rmeta in zip(result["responses"], result["response_metadata"]):
+            # drop the rules the user took back
+            if type(r).__name__ == "RemoveDoc":
+                store.delete(namespace, r.json_doc_id)
+                continue
+
+            # trick to update existing memory or create new one
+            store_key = rmeta.get("json_doc_id", str(uuid.uuid4()))
+            value = r.model_dump(mode="json")
+
+            # skip the write if the patch left the rule unchanged
+            if existing_values.get(store_key) == value:
+                continue
+
+            # save memory to store
+            store.put(
+                namespace,
+                store_key,
+                value,
+            )
+
         # Return tool message with update verification
         tool_calls = state['messages'][-1].tool_calls
+
+        # Human readable message about the instructions update
+        if result.get("deadline_exceeded"):
+            instructions_update_msg = DEADLINE_EXCEEDED_MESSAGE
+        else:
+            instructions_update_msg = spy.extract_tool_info(self.TOOL_NAME)
+        logger.info(f"Instructions update message: {instructions_update_msg}")
+
         result = {
             "messages":
                 [
                     {
                         "role": "tool",
-                        "content": "updated instructions",
+                        "content": instructions_update_msg or "updated instructions",
                         "tool_call_id": tool_calls[0]['id']  # Need for tool call validation by the agent
                     }
                 ]
         }
         return result
 
-    def get_formatted_instruction(self, existing_memory) -> str:
-        return self.TRUSTCALL_INSTRUCTION.format(
-            current_instructions=existing_memory.value if existing_memory else None,
-            time=datetime.now().isoformat()
-        )
+    def _migrate_legacy(self, key: str, value: dict, namespace: tuple, store: BaseStore) -> dict | None:
+        """Convert instructions stored as free text into a single Instruction rule.
+
+        Returns:
+            The rule, or None if the legacy instructions were empty and got deleted
+        """
+        if "memory" not in value:
+            return value
+        memory = value["memory"]
+        if not memory:
+            store.delete(namespace, key)
+            logger.info(f"Deleted empty free-text instructions {key}")
+            return None
+        rule = memory if isinstance(memory, str) else json.dumps(memory)
+        migrated = Instruction(rule=rule).model_dump(mode="json")
+        store.put(namespace, key, migrated)
+        logger.info(f"Migrated free-text instructions {key} to an Instruction rule")
+        return migrated
+
+    def get_formatted_instruction(self) -> str:
+        return self.TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+
+
+class Instruction(BaseModel):
+    """A single user preference for how to update the ToDo list"""
+    rule: str = Field(
+        description="One self-contained rule describing how the user likes ToDo items to be added or updated"
+    )
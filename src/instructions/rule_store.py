@@ -0,0 +1,20 @@
+from langgraph.store.base import BaseStore, SearchItem
+
+
+def search_all(store: BaseStore, namespace: tuple[str, ...], page_size: int = 100) -> list[SearchItem]:
+    """Get every item of a namespace, paging past the store's default search limit.
+
+    Args:
+        store: Storage holding the items
+        namespace: Namespace prefix to search
+        page_size: Number of items fetched per search call
+
+    Returns:
+        All items of the namespace
+    """
+    items = []
+    while True:
+        page = store.search(namespace, limit=page_size, offset=len(items))
+        items.extend(page)
+        if len(page) < page_size:
+            return items
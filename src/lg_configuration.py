@@ -10,6 +10,14 @@ from dataclasses import dataclass
 class Configuration:
     """The configurable fields for the chatbot."""
     user_id: str = "default-user"
+    speculative_extraction: bool = False
+
+    def __post_init__(self):
+        # Values read from the environment arrive as strings
+        if isinstance(self.speculative_extraction, str):
+            self.speculative_extraction = (
+                self.speculative_extraction.lower() in ("1", "true", "yes")
+            )
 
     @classmethod
     def from_runnable_config(
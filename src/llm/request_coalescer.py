@@ -0,0 +1,255 @@
+import json
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from queue import Empty, Queue
+from typing import Any, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by every request of the coalescer."""
+
+    def __init__(self, tokens_per_second: float, capacity: float):
+        """Initialize a full bucket.
+
+        Args:
+            tokens_per_second: Rate at which the bucket refills
+            capacity: Maximum number of tokens the bucket can hold
+        """
+        self._rate = tokens_per_second
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float):
+        """Block until the requested tokens are available and take them.
+
+        Requests larger than the capacity are clamped so they can still run.
+        """
+        tokens = min(tokens, self._capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity,
+                    self._tokens + (now - self._updated_at) * self._rate
+                )
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def adjust(self, tokens: float):
+        """Take (or give back) tokens without waiting, e.g. to settle an estimate.
+
+        The balance may go negative, later requests then wait for the debt.
+        """
+        with self._lock:
+            self._tokens = min(self._capacity, self._tokens - tokens)
+
+
+@dataclass
+class _Job:
+    messages: list[BaseMessage]
+    kwargs: dict[str, Any]
+    future: Future = field(default_factory=Future)
+
+
+class RequestCoalescer:
+    """Collects chat requests from concurrent graph runs and dispatches them together.
+
+    Requests are gathered for up to ``max_wait_ms`` after the first one
+    arrives, or until ``max_batch_size`` are waiting. Requests with the same
+    bound tool schemas and options are sent through the model's ``batch``
+    method, so a provider with a batch endpoint can override it, and
+    requests with different options are dispatched concurrently. Every
+    request takes its estimated tokens from a shared token bucket before
+    being sent: the messages, the bound tool schemas and ``max_tokens`` (or
+    ``expected_output_tokens``) of completion. Once the response arrives the
+    estimate is settled against its reported token usage.
+    """
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        tokens_per_second: Optional[float] = None,
+        burst_tokens: Optional[float] = None,
+        max_workers: int = 16,
+        expected_output_tokens: int = 256,
+    ):
+        """Initialize the coalescer.
+
+        Args:
+            model: The language model requests are dispatched to
+            max_batch_size: Number of requests that triggers an immediate dispatch
+            max_wait_ms: Time to wait for more requests after the first one
+            tokens_per_second: Shared rate limit, no limit if None
+            burst_tokens: Bucket capacity, defaults to one second of tokens
+            max_workers: Number of provider calls dispatched concurrently
+            expected_output_tokens: Completion tokens charged up front when
+                the request does not set max_tokens
+        """
+        self._model = model
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._expected_output_tokens = expected_output_tokens
+        self._bucket = (
+            TokenBucket(tokens_per_second, burst_tokens or tokens_per_second)
+            if tokens_per_second else None
+        )
+        self._queue: Queue[_Job] = Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="coalescer-dispatch"
+        )
+        self._collector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, messages: list[BaseMessage], **kwargs) -> BaseMessage:
+        """Queue a request and wait for its response."""
+        job = _Job(messages=messages, kwargs=kwargs)
+        self._ensure_collector()
+        self._queue.put(job)
+        return job.future.result()
+
+    def _ensure_collector(self):
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(
+                    target=self._collect,
+                    name="coalescer-collector",
+                    daemon=True
+                )
+                self._collector.start()
+
+    def _collect(self):
+        """Group queued requests into batches and hand them to the dispatchers."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            groups = self._group(batch)
+            logger.debug(f"Dispatching batch of {len(batch)} requests in {len(groups)} groups")
+            # Groups are independent provider calls, dispatch them concurrently
+            for group in groups:
+                self._executor.submit(self._dispatch, group)
+
+    def _group(self, batch: list[_Job]) -> list[list[_Job]]:
+        """Split a batch by bound options, requests can only share a provider call if they match."""
+        groups: dict[str, list[_Job]] = {}
+        for job in batch:
+            try:
+                key = self._options_key(job.kwargs)
+            except Exception as e:
+                job.future.set_exception(e)
+                continue
+            groups.setdefault(key, []).append(job)
+        return list(groups.values())
+
+    def _options_key(self, kwargs: dict[str, Any]) -> str:
+        """Key of the bound options, tools compare by their schema.
+
+        Trustcall creates new tool classes on every extraction (e.g. RemoveDoc),
+        so comparing the classes themselves would never group its requests.
+        """
+        options = dict(kwargs)
+        if options.get("tools") is not None:
+            options["tools"] = [convert_to_openai_tool(tool) for tool in options["tools"]]
+        return json.dumps(options, sort_keys=True, default=repr)
+
+    def _dispatch(self, group: list[_Job]):
+        """Send a group of requests to the model and hand each response back to its caller."""
+        estimates = [0] * len(group)
+        try:
+            estimates = [
+                self._estimate_tokens(job.kwargs, job.messages) for job in group
+            ]
+            if self._bucket is not None:
+                for estimate in estimates:
+                    self._bucket.acquire(estimate)
+            bound = self._bind(group[0].kwargs)
+            outputs = bound.batch(
+                [job.messages for job in group],
+                return_exceptions=True
+            )
+        except Exception as e:
+            outputs = [e] * len(group)
+
+        for job, estimate, output in zip(group, estimates, outputs):
+            if isinstance(output, Exception):
+                job.future.set_exception(output)
+                continue
+            usage = getattr(output, "usage_metadata", None)
+            if self._bucket is not None and usage:
+                self._bucket.adjust(usage["total_tokens"] - estimate)
+            job.future.set_result(output)
+
+    def _estimate_tokens(self, kwargs: dict[str, Any], messages: list[BaseMessage]) -> int:
+        """Approximate tokens of a request: messages, tool schemas and completion."""
+        tools = kwargs.get("tools") or []
+        tool_chars = sum(len(json.dumps(convert_to_openai_tool(tool))) for tool in tools)
+        return (
+            count_tokens_approximately(messages)
+            + math.ceil(tool_chars / 4)
+            + kwargs.get("max_tokens", self._expected_output_tokens)
+        )
+
+    def _bind(self, kwargs: dict[str, Any]):
+        kwargs = dict(kwargs)
+        tools = kwargs.pop("tools", None)
+        if tools is not None:
+            return self._model.bind_tools(tools, **kwargs)
+        return self._model.bind(**kwargs)
+
+
+class CoalescingChatModel(BaseChatModel):
+    """Chat model that sends its requests through a shared RequestCoalescer.
+
+    Tools are bound lazily: ``bind_tools`` only records them so that the
+    coalescer can group requests with the same tools before binding them on
+    the underlying model.
+    """
+    coalescer: RequestCoalescer
+
+    @property
+    def _llm_type(self) -> str:
+        return "coalescing-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=list(tools), **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if stop is not None:
+            kwargs["stop"] = stop
+        message = self.coalescer.submit(messages, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
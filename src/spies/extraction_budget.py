@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config, merge_configs
+
+from spies.extraction_metrics import extraction_metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ExtractionDeadlineExceeded(Exception):
+    """Raised when an extraction would start an LLM call after its deadline."""
+
+
+DEADLINE_EXCEEDED_MESSAGE = "update skipped: extraction deadline exceeded"
+
+
+class ExtractionBudget(BaseCallbackHandler):
+    """Bounds the trustcall validation-repair loop of a single extraction.
+
+    The number of repair rounds is enforced by trustcall through the
+    ``max_attempts`` configurable. The deadline is checked before every LLM
+    call, so a call already in flight is allowed to finish.
+    """
+    raise_error = True
+
+    def __init__(self, max_repair_rounds: int = 1, deadline_s: Optional[float] = None):
+        """Start the budget clock.
+
+        Args:
+            max_repair_rounds: LLM repair rounds allowed after the first extraction
+            deadline_s: Seconds after which no new LLM call is started, no limit if None
+        """
+        self.max_repair_rounds = max_repair_rounds
+        self.llm_calls = 0
+        self.repair_rounds = 0
+        self.deadline_exceeded = False
+        self._deadline = time.monotonic() + deadline_s if deadline_s is not None else None
+        self._lock = threading.Lock()
+
+    def invoke(self, extractor: Runnable, inputs: dict, schema_name: str) -> dict:
+        """Run a trustcall extractor within the budget and record its cost.
+
+        Args:
+            extractor: The trustcall extractor
+            inputs: Messages and existing documents for the extractor
+            schema_name: Name of the extracted schema, used for the metrics
+
+        Returns:
+            The trustcall result, or the skipped result if the deadline was hit
+        """
+        try:
+            result = extractor.invoke(inputs, config=self.config())
+        except ExtractionDeadlineExceeded:
+            pass
+        if self.deadline_exceeded:
+            # Trustcall may also stop the loop itself, drop whatever it returned
+            logger.warning(f"{schema_name} extraction stopped at its deadline after {self.llm_calls} LLM calls")
+            result = self.skipped_result()
+        else:
+            # Trustcall counts a round once, however many patch calls it fans out to
+            self.repair_rounds = max(result.get("attempts", 1) - 1, 0)
+        extraction_metrics.record(schema_name, self)
+        return result
+
+    def config(self) -> RunnableConfig:
+        """Config for the extractor invocation, keeping the parent callbacks."""
+        return merge_configs(
+            ensure_config(),
+            {
+                "callbacks": [self],
+                "configurable": {"max_attempts": self.max_repair_rounds + 1},
+            }
+        )
+
+    def skipped_result(self) -> dict:
+        """Extraction result used when the deadline was hit, nothing is saved from it."""
+        return {
+            "messages": [],
+            "responses": [],
+            "response_metadata": [],
+            "deadline_exceeded": True,
+        }
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list, **kwargs: Any):
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self.deadline_exceeded = True
+            raise ExtractionDeadlineExceeded(
+                f"Extraction deadline exceeded after {self.llm_calls} LLM calls"
+            )
+        with self._lock:
+            self.llm_calls += 1
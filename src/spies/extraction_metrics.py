@@ -0,0 +1,46 @@
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from spies.extraction_budget import ExtractionBudget
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ExtractionMetrics:
+    """Aggregates how many repair rounds each trustcall schema costs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = defaultdict(
+            lambda: {
+                "extractions": 0,
+                "repair_rounds": 0,
+                "max_repair_rounds": 0,
+                "deadline_exceeded": 0,
+            }
+        )
+
+    def record(self, schema_name: str, budget: "ExtractionBudget"):
+        """Record the cost of one finished extraction."""
+        with self._lock:
+            stats = self._stats[schema_name]
+            stats["extractions"] += 1
+            stats["repair_rounds"] += budget.repair_rounds
+            stats["max_repair_rounds"] = max(stats["max_repair_rounds"], budget.repair_rounds)
+            stats["deadline_exceeded"] += int(budget.deadline_exceeded)
+        logger.info(
+            f"{schema_name} extraction: repair_rounds={budget.repair_rounds}, "
+            f"deadline_exceeded={budget.deadline_exceeded}"
+        )
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """Snapshot of the metrics per schema."""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# Shared by every memory tool of the process
+extraction_metrics = ExtractionMetrics()
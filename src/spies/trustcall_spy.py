@@ -6,6 +6,7 @@ logger = logging.getLogger(__name__)
 class Spy:
     def __init__(self):
         self.called_tools = []
+        self.total_tokens = 0
 
     def __call__(self, run):
         q = [run]
@@ -14,9 +15,10 @@ class Spy:
             if r.child_runs:
                 q.extend(r.child_runs)
             if r.run_type == "chat_model":
-                self.called_tools.append(
-                    r.outputs["generations"][0][0]["message"]["kwargs"]["tool_calls"]
-                )
+                message = r.outputs["generations"][0][0]["message"]["kwargs"]
+                self.called_tools.append(message["tool_calls"])
+                usage = message.get("usage_metadata") or {}
+                self.total_tokens += usage.get("total_tokens", 0)
 
     def extract_tool_info(self, schema_name: str = "Memory"):
         """Extract information from tool calls for both patches and new memories.
@@ -45,6 +47,11 @@ class Spy:
                             'planned_edits': call['args']['planned_edits'],
                             'value': call['args']['patches'][0]['value']
                         })
+                elif call['name'] == 'RemoveDoc':
+                    changes.append({
+                        'type': 'remove',
+                        'doc_id': call['args']['json_doc_id'],
+                    })
                 elif call['name'] == schema_name:
                     changes.append({
                         'type': 'new',
@@ -60,6 +67,10 @@ class Spy:
                     f"Plan: {change['planned_edits']}\n"
                     f"Added content: {change['value']}"
                 )
+            elif change['type'] == 'remove':
+                result_parts.append(
+                    f"Document {change['doc_id']} removed"
+                )
             else:
                 result_parts.append(
                     f"New {schema_name} created:\n"
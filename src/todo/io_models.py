@@ -1,11 +1,15 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Literal
+import re
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, ClassVar, Optional, Literal
 from datetime import datetime
 
 
 class ToDo(BaseModel):
     task: str = Field(description="The task to be completed.")
-    time_to_complete: Optional[int] = Field(description="Estimated time to complete the task (minutes).")
+    time_to_complete: Optional[int] = Field(
+        description="Estimated time to complete the task (minutes).",
+        default=None
+    )
     deadline: Optional[datetime] = Field(
         description="When the task needs to be completed by (if applicable)",
         default=None
@@ -19,3 +23,36 @@ class ToDo(BaseModel):
         description="Current status of the task",
         default="not started"
     )
+
+    _DURATION: ClassVar[re.Pattern] = re.compile(
+        r"(\d+(?:\.\d+)?)\s*(m|mins?|minutes?|h|hrs?|hours?)?"
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def repair_fields(cls, data: Any) -> Any:
+        """Fix common model mistakes locally instead of asking trustcall for a repair round."""
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+
+        # An empty or missing list of solutions falls back to the default
+        solutions = data.get("solutions")
+        if not solutions:
+            data.pop("solutions", None)
+        elif isinstance(solutions, str):
+            data["solutions"] = [solutions]
+
+        # "30", "30 minutes", "1.5 hours" or 30.0 become minutes. Anything
+        # else is left to trustcall's repair round instead of guessing.
+        time_to_complete = data.get("time_to_complete")
+        if isinstance(time_to_complete, float):
+            data["time_to_complete"] = round(time_to_complete)
+        elif isinstance(time_to_complete, str):
+            match = cls._DURATION.fullmatch(time_to_complete.strip().lower())
+            if match:
+                amount, unit = float(match.group(1)), match.group(2)
+                minutes = amount * 60 if unit and unit.startswith("h") else amount
+                data["time_to_complete"] = round(minutes)
+
+        return data
@@ -12,6 +12,7 @@ import trustcall
 from lg_configuration import Configuration
 from todo.io_models import ToDo
 from spies.trustcall_spy import Spy
+from spies.extraction_budget import DEADLINE_EXCEEDED_MESSAGE, ExtractionBudget
 
 import logging
 logger = logging.getLogger(__name__)
@@ -29,8 +30,17 @@ class TodoTool:
 
     System Time: {time}"""
 
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, max_repair_rounds: int = 1, deadline_s: float | None = 30.0):
+        """Initialize the tool.
+
+        Args:
+            llm: The language model to use
+            max_repair_rounds: Trustcall repair rounds allowed per extraction
+            deadline_s: Seconds after which an extraction stops starting LLM calls
+        """
         self.llm = llm
+        self.max_repair_rounds = max_repair_rounds
+        self.deadline_s = deadline_s
 
     def run_tool(self, state: MessagesState, config: RunnableConfig, store: BaseStore):
         """Reflect on the chat history and update the memory collection."""
@@ -38,6 +48,35 @@ class TodoTool:
         configurable = Configuration.from_runnable_config(config)
         user_id = configurable.user_id
 
+        # Extract the updates and save them to the store
+        result, spy = self.extract(state["messages"][:-1], user_id, store)
+        todo_update_msg = self.save(result, spy, user_id, store)
+
+        # Return tool message with update verification
+        tool_calls = state['messages'][-1].tool_calls
+        result = {
+            "messages":
+                [
+                    {
+                        "role": "tool",
+                        "content": todo_update_msg,
+                        "tool_call_id": tool_calls[0]['id']  # Need for tool call validation by the agent
+                    }
+                ]
+        }
+        return result
+
+    def extract(self, messages: list, user_id: str, store: BaseStore) -> tuple[dict, Spy]:
+        """Run the trustcall extractor over the messages without writing to the store.
+
+        Args:
+            messages: Chat history to reflect on (without the UpdateMemory call)
+            user_id: The user whose todo list is extracted
+            store: Storage holding the existing todo items
+
+        Returns:
+            The trustcall result and the spy that observed the tool calls
+        """
         # get namespace for todo
         namespace = (self.STORE_KEY, user_id)
 
@@ -55,7 +94,7 @@ class TodoTool:
             merge_message_runs(
                 messages= [
                     SystemMessage(content=self.get_formatted_instruction())
-                ] + state["messages"][:-1]
+                ] + messages
             )
         )
 
@@ -69,13 +108,28 @@ class TodoTool:
             enable_inserts=True
         ).with_listeners(on_end=spy)
 
-        # Invoke the extractor
-        result = todo_extractor.invoke(
+        # Invoke the extractor within the repair budget
+        budget = ExtractionBudget(self.max_repair_rounds, self.deadline_s)
+        result = budget.invoke(
+            todo_extractor,
             {
                 "messages": updated_messages,
                 "existing": existing_memories
-            }
+            },
+            self.TOOL_NAME
         )
+        return result, spy
+
+    def save(self, result: dict, spy: Spy, user_id: str, store: BaseStore) -> str:
+        """Save an extraction result to the store.
+
+        Returns:
+            Human readable message about the ToDo update
+        """
+        if result.get("deadline_exceeded"):
+            return DEADLINE_EXCEEDED_MESSAGE
+
+        namespace = (self.STORE_KEY, user_id)
 
         # Process the results
         for r, rmeta in zip(result["responses"], result["response_metadata"]):
@@ -89,24 +143,9 @@ class TodoTool:
                 r.model_dump(mode="json"),
             )
 
-        # Return tool message with update verification
-        tool_calls = state['messages'][-1].tool_calls
-
-        # Human readable message about the ToDo update
         todo_update_msg = spy.extract_tool_info(self.TOOL_NAME)
         logger.info(f"Todo update message: {todo_update_msg}")
-
-        result = {
-            "messages":
-                [
-                    {
-                        "role": "tool",
-                        "content": todo_update_msg,
-                        "tool_call_id": tool_calls[0]['id']  # Need for tool call validation by the agent
-                    }
-                ]
-        }
-        return result
+        return todo_update_msg
 
     def get_formatted_instruction(self) -> str:
         return self.TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
@@ -6,13 +6,23 @@ class ProfileFactory:
     """Factory for creating profile-related tools."""
 
     @staticmethod
-    def create(llm: BaseChatModel) -> ProfileTool:
+    def create(
+        llm: BaseChatModel,
+        max_repair_rounds: int = 1,
+        deadline_s: float | None = 30.0,
+    ) -> ProfileTool:
         """Create a ProfileTool instance.
 
         Args:
             llm: The language model to use
+            max_repair_rounds: Trustcall repair rounds allowed per extraction
+            deadline_s: Seconds after which an extraction stops starting LLM calls
 
         Returns:
             An instance of ProfileTool
         """
-        return ProfileTool(llm=llm)
+        return ProfileTool(
+            llm=llm,
+            max_repair_rounds=max_repair_rounds,
+            deadline_s=deadline_s
+        )
@@ -11,6 +11,11 @@ from langchain_core.messages import merge_message_runs
 import trustcall
 from lg_configuration import Configuration
 from user_profile.io_models import Profile
+from spies.trustcall_spy import Spy
+from spies.extraction_budget import DEADLINE_EXCEEDED_MESSAGE, ExtractionBudget
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 class ProfileTool:
@@ -25,12 +30,21 @@ class ProfileTool:
 
     System Time: {time}"""
 
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, max_repair_rounds: int = 1, deadline_s: float | None = 30.0):
+        """Initialize the tool.
+
+        Args:
+            llm: The language model to use
+            max_repair_rounds: Trustcall repair rounds allowed per extraction
+            deadline_s: Seconds after which an extraction stops starting LLM calls
+        """
         self.profile_extractor = trustcall.create_extractor(
             llm,
             tools=[Profile],
             tool_choice="Profile",
         )
+        self.max_repair_rounds = max_repair_rounds
+        self.deadline_s = deadline_s
 
     def run_tool(self, state: MessagesState, config: RunnableConfig, store: BaseStore):
         """Reflect on the chat history and update the memory collection."""
@@ -38,6 +52,35 @@ class ProfileTool:
         configurable = Configuration.from_runnable_config(config)
         user_id = configurable.user_id
 
+        # Extract the updates and save them to the store
+        result, spy = self.extract(state["messages"][:-1], user_id, store)
+        profile_update_msg = self.save(result, spy, user_id, store)
+
+        # Return tool message with update verification
+        tool_calls = state['messages'][-1].tool_calls
+        result = {
+            "messages":
+                [
+                    {
+                        "role": "tool",
+                        "content": profile_update_msg,
+                        "tool_call_id":tool_calls[0]['id']  # Need for tool call validation by the agent
+                    }
+                ]
+        }
+        return result
+
+    def extract(self, messages: list, user_id: str, store: BaseStore) -> tuple[dict, Spy]:
+        """Run the profile extractor over the messages without writing to the store.
+
+        Args:
+            messages: Chat history to reflect on (without the UpdateMemory call)
+            user_id: The user whose profile is extracted
+            store: Storage holding the existing profile
+
+        Returns:
+            The trustcall result and the spy that observed the tool calls
+        """
         # get namespace for profile
         namespace = (self.STORE_KEY, user_id)
 
@@ -55,16 +98,33 @@ class ProfileTool:
             merge_message_runs(
                 messages=[
                     SystemMessage(content=self.get_formatted_instruction())
-                ] + state["messages"][:-1]
+                ] + messages
             )
         )
 
         # Call profile extractor with new messages and existing memories
-        result = self.profile_extractor.invoke({
-            "messages": updated_messages,
-            "existing": existing_memories
-        })
+        spy = Spy()
+        budget = ExtractionBudget(self.max_repair_rounds, self.deadline_s)
+        result = budget.invoke(
+            self.profile_extractor.with_listeners(on_end=spy),
+            {
+                "messages": updated_messages,
+                "existing": existing_memories
+            },
+            self.TOOL_NAME
+        )
+        return result, spy
+
+    def save(self, result: dict, spy: Spy, user_id: str, store: BaseStore) -> str:
+        """Save an extraction result to the store.
 
+        Returns:
+            Message confirming the profile update
+        """
+        if result.get("deadline_exceeded"):
+            return DEADLINE_EXCEEDED_MESSAGE
+
+        namespace = (self.STORE_KEY, user_id)
 
         for r, rmeta in zip(result["responses"], result["response_metadata"]):
             # trick to update existing memory or create new one
@@ -76,20 +136,7 @@ class ProfileTool:
                 store_key,
                 r.model_dump(mode="json"),
             )
-
-        # Return tool message with update verification
-        tool_calls = state['messages'][-1].tool_calls
-        result = {
-            "messages":
-                [
-                    {
-                        "role": "tool",
-                        "content": "updated profile",
-                        "tool_call_id":tool_calls[0]['id']  # Need for tool call validation by the agent
-                    }
-                ]
-        }
-        return result
+        return "updated profile"
 
     def get_formatted_instruction(self) -> str:
         return self.TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
@@ -0,0 +1,180 @@
+import json
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import MessagesState
+
+from checkpointer.compact_saver import CompactCheckpointSaver
+
+
+def agent(state: MessagesState):
+    return {"messages": [AIMessage(content=f"agent step {len(state['messages'])} " + "x" * 200)]}
+
+
+def tool(state: MessagesState):
+    return {"messages": [AIMessage(content=f"tool result {len(state['messages'])} " + "y" * 200)]}
+
+
+def route(state: MessagesState):
+    # agent -> tool -> agent -> tool -> agent on every user turn
+    since_user = 0
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage):
+            break
+        since_user += 1
+    return "tool" if since_user < 4 else END
+
+
+def build_graph(saver: CompactCheckpointSaver):
+    builder = StateGraph(MessagesState)
+    builder.add_node("agent", agent)
+    builder.add_node("tool", tool)
+    builder.add_edge(START, "agent")
+    builder.add_conditional_edges("agent", route)
+    builder.add_edge("tool", "agent")
+    return builder.compile(checkpointer=saver)
+
+
+def stored_bytes(conn: sqlite3.Connection) -> int:
+    total = conn.execute(
+        "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints"
+    ).fetchone()[0]
+    for table in ("blobs", "messages", "writes"):
+        total += conn.execute(f"SELECT COALESCE(SUM(LENGTH(blob)), 0) FROM {table}").fetchone()[0]
+    return total
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    yield conn
+    conn.close()
+
+
+CONFIG = {"configurable": {"thread_id": "thread-1"}}
+
+
+def run_turns(graph, turns: int, start: int = 0):
+    for turn in range(start, start + turns):
+        graph.invoke({"messages": [HumanMessage(content=f"turn {turn}")]}, CONFIG)
+
+
+def contents(graph, config=CONFIG) -> list[str]:
+    return [message.content for message in graph.get_state(config).values["messages"]]
+
+
+def test_state_survives_restart(conn):
+    graph = build_graph(CompactCheckpointSaver(conn))
+    run_turns(graph, 3)
+    expected = contents(graph)
+    assert len(expected) == 18
+
+    # A new saver has no cache and rebuilds the messages from the log
+    restarted = build_graph(CompactCheckpointSaver(conn))
+    assert contents(restarted) == expected
+
+    run_turns(restarted, 1, start=3)
+    assert contents(restarted)[:18] == expected
+    assert len(contents(restarted)) == 24
+    # Messages already in the log are not written again
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 24
+
+
+def test_bytes_written_per_turn_stay_constant(conn):
+    graph = build_graph(CompactCheckpointSaver(conn))
+    written = []
+    for turn in range(20):
+        before = stored_bytes(conn)
+        run_turns(graph, 1, start=turn)
+        written.append(stored_bytes(conn) - before)
+
+    assert max(written[2:]) < written[2] * 1.2
+
+
+def test_fork_from_old_checkpoint(conn):
+    graph = build_graph(CompactCheckpointSaver(conn))
+    run_turns(graph, 3)
+    first_turn = next(
+        state for state in graph.get_state_history(CONFIG)
+        if len(state.values.get("messages", [])) == 6 and not state.next
+    )
+
+    graph.invoke({"messages": [HumanMessage(content="fork")]}, first_turn.config)
+
+    forked = contents(graph)
+    assert forked[:6] == [message.content for message in first_turn.values["messages"]]
+    assert forked[6] == "fork"
+    assert len(forked) == 12
+    assert contents(build_graph(CompactCheckpointSaver(conn))) == forked
+
+
+def test_removed_messages(conn):
+    graph = build_graph(CompactCheckpointSaver(conn))
+    run_turns(graph, 2)
+    messages = graph.get_state(CONFIG).values["messages"]
+
+    graph.update_state(CONFIG, {"messages": [RemoveMessage(id=messages[1].id)]})
+
+    expected = [message.content for message in messages if message.id != messages[1].id]
+    assert contents(graph) == expected
+    assert contents(build_graph(CompactCheckpointSaver(conn))) == expected
+    run_turns(graph, 1, start=2)
+    assert contents(graph)[:11] == expected
+
+
+def test_prune_intermediate_checkpoints(conn):
+    graph = build_graph(CompactCheckpointSaver(conn, prune_intermediate=True))
+    unpruned = build_graph(CompactCheckpointSaver(sqlite3.connect(":memory:", check_same_thread=False)))
+    run_turns(graph, 4)
+    run_turns(unpruned, 4)
+
+    assert len(list(graph.get_state_history(CONFIG))) < len(list(unpruned.get_state_history(CONFIG)))
+    assert contents(graph) == contents(unpruned)
+
+    restarted = build_graph(CompactCheckpointSaver(conn, prune_intermediate=True))
+    run_turns(restarted, 1, start=4)
+    assert len(contents(restarted)) == 30
+
+
+def test_delta_chain_is_bounded(conn):
+    graph = build_graph(CompactCheckpointSaver(conn, snapshot_every=3))
+    run_turns(graph, 5)
+
+    depths = [
+        json.loads(blob)["depth"]
+        for (blob,) in conn.execute("SELECT blob FROM blobs WHERE type = 'messages-delta'")
+    ]
+    assert max(depths) == 2
+    assert depths.count(0) > 1
+    assert len(contents(build_graph(CompactCheckpointSaver(conn, snapshot_every=3)))) == 30
+
+
+def test_zstd_compression(conn):
+    pytest.importorskip("zstandard")
+    graph = build_graph(CompactCheckpointSaver(conn, compress=True))
+    run_turns(graph, 2)
+
+    types = {type_ for (type_,) in conn.execute("SELECT type FROM messages")}
+    assert types and all(type_.endswith("+zstd") for type_ in types)
+    assert len(contents(build_graph(CompactCheckpointSaver(conn, compress=True)))) == 12
+
+
+def test_message_cache_is_bounded(conn):
+    saver = CompactCheckpointSaver(conn, cache_size=2)
+    graph = build_graph(saver)
+    threads = [{"configurable": {"thread_id": f"thread-{i}"}} for i in range(3)]
+    for config in threads:
+        graph.invoke({"messages": [HumanMessage(content="turn 0")]}, config)
+
+    assert list(saver._last_messages) == [("thread-1", ""), ("thread-2", "")]
+    # The cache holds fingerprints, not the messages
+    assert all(isinstance(fingerprint, int) for fingerprint in saver._last_messages[("thread-2", "")][1])
+
+    # The evicted thread reloads its base and still only logs the new messages
+    logged = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    graph.invoke({"messages": [HumanMessage(content="turn 1")]}, threads[0])
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == logged + 6
+    assert len(contents(graph, threads[0])) == 12
+    assert len(saver._last_messages) == 2
@@ -0,0 +1,163 @@
+import threading
+from concurrent.futures import wait
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.store.base import BaseStore
+from langgraph.store.memory import InMemoryStore
+
+from graph.master_agent import MasterAgent
+from graph.speculative_extractor import SpeculativeExtractor
+from spies.trustcall_spy import Spy
+
+
+class StubTool:
+    """Extraction tool saving the last message under its own namespace."""
+
+    def __init__(self, name: str, tokens: int = 10, error: Optional[Exception] = None):
+        self.name = name
+        self.tokens = tokens
+        self.error = error
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+        self.extract_calls = 0
+
+    def extract(self, messages: list, user_id: str, store: BaseStore) -> tuple[dict, Spy]:
+        self.extract_calls += 1
+        self.started.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        spy = Spy()
+        spy.total_tokens = self.tokens
+        return {"content": messages[-1].content}, spy
+
+    def save(self, result: dict, spy: Spy, user_id: str, store: BaseStore) -> str:
+        store.put((self.name, user_id), "last", result)
+        return f"updated {self.name}"
+
+
+class AgentModel(BaseChatModel):
+    """Local agent model asking for the given memory update."""
+    update_type: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "agent"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tool_calls = []
+        if self.update_type is not None:
+            tool_calls = [{"name": "UpdateMemory", "args": {"update_type": self.update_type}, "id": "update-1"}]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=tool_calls))])
+
+
+def agent_response(update_type: str) -> AIMessage:
+    return AIMessage(
+        content="",
+        tool_calls=[{"name": "UpdateMemory", "args": {"update_type": update_type}, "id": "update-1"}],
+    )
+
+
+def test_matching_extraction_is_saved():
+    store = InMemoryStore()
+    tools = {"todo": StubTool("todo"), "user": StubTool("profile", tokens=7)}
+    speculator = SpeculativeExtractor(tools)
+
+    pending = speculator.start([HumanMessage("buy milk")], "user-1", store)
+    wait(pending.values())
+    result = speculator.resolve(pending, agent_response("todo"), "user-1", store)
+
+    assert result == {"role": "tool", "content": "updated todo", "tool_call_id": "update-1"}
+    assert store.get(("todo", "user-1"), "last").value == {"content": "buy milk"}
+    assert store.get(("profile", "user-1"), "last") is None
+    assert (speculator.hits, speculator.attempts, speculator.wasted_tokens) == (1, 1, 7)
+
+
+def test_other_update_type_discards_every_extraction():
+    store = InMemoryStore()
+    tools = {"todo": StubTool("todo", tokens=10), "user": StubTool("profile", tokens=7)}
+    speculator = SpeculativeExtractor(tools)
+
+    pending = speculator.start([HumanMessage("use emojis")], "user-1", store)
+    wait(pending.values())
+    result = speculator.resolve(pending, agent_response("instructions"), "user-1", store)
+
+    assert result is None
+    assert store.search(("todo", "user-1")) == []
+    assert (speculator.hits, speculator.attempts, speculator.wasted_tokens) == (0, 1, 17)
+
+
+def test_failed_extraction_is_a_miss():
+    store = InMemoryStore()
+    speculator = SpeculativeExtractor({"todo": StubTool("todo", error=RuntimeError("provider down"))})
+
+    pending = speculator.start([HumanMessage("buy milk")], "user-1", store)
+    result = speculator.resolve(pending, agent_response("todo"), "user-1", store)
+
+    assert result is None
+    assert speculator.hit_rate == 0.0
+
+
+def test_queued_extractions_are_cancelled():
+    store = InMemoryStore()
+    busy, todo = StubTool("profile"), StubTool("todo")
+    busy.release.clear()
+    speculator = SpeculativeExtractor({"user": busy, "todo": todo}, max_workers=1)
+
+    pending = speculator.start([HumanMessage("buy milk")], "user-1", store)
+    busy.started.wait()
+    result = speculator.resolve(pending, agent_response("todo"), "user-1", store)
+    busy.release.set()
+    # Joins the worker, so the discarded extraction has been counted
+    speculator._executor.shutdown(wait=True)
+
+    # The todo extraction was still queued behind the running one
+    assert result is None
+    assert todo.extract_calls == 0
+    assert pending["todo"].cancelled()
+    assert speculator.wasted_tokens == busy.tokens
+
+
+def test_agent_commits_the_speculated_update(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    from graph.graph import route_message
+
+    store = InMemoryStore()
+    agent = MasterAgent(AgentModel(update_type="todo"), SpeculativeExtractor({"todo": StubTool("todo")}))
+    config = {"configurable": {"user_id": "user-1", "speculative_extraction": True}}
+
+    messages = [HumanMessage("buy milk")]
+    messages += agent.run({"messages": messages}, config, store)["messages"]
+
+    assert messages[-1]["content"] == "updated todo"
+    state = {"messages": [ToolMessage(content="updated todo", tool_call_id="update-1")]}
+    assert route_message(state, config, store) == "task_mAIstro"
+
+
+def test_agent_falls_back_to_the_update_node(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    from graph.graph import route_message
+
+    store = InMemoryStore()
+    tool = StubTool("todo", error=RuntimeError("provider down"))
+    agent = MasterAgent(AgentModel(update_type="todo"), SpeculativeExtractor({"todo": tool}))
+    config = {"configurable": {"user_id": "user-1", "speculative_extraction": True}}
+
+    messages = [HumanMessage("buy milk")]
+    messages += agent.run({"messages": messages}, config, store)["messages"]
+
+    assert isinstance(messages[-1], AIMessage)
+    assert route_message({"messages": messages}, config, store) == "update_todos"
@@ -0,0 +1,136 @@
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.store.memory import InMemoryStore
+
+from graph.master_agent import MasterAgent
+from instructions.instructions_tool import InstructionsTool
+from lg_configuration import Configuration
+
+CONFIG = {"configurable": {"user_id": "user-1"}}
+USER_ID = Configuration.from_runnable_config(CONFIG).user_id
+NAMESPACE = ("instructions", USER_ID)
+
+
+class ScriptedModel(BaseChatModel):
+    """Local model answering with the scripted tool calls and recording its prompts."""
+    responses: list = []
+    prompts: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.prompts.append(messages)
+        tool_calls = [
+            {"name": name, "args": args, "id": f"call-{i}"}
+            for i, (name, args) in enumerate(self.responses.pop(0))
+        ]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=tool_calls))])
+
+
+def patch(doc_id: str, rule: str) -> tuple[str, dict]:
+    return "PatchDoc", {
+        "json_doc_id": doc_id,
+        "planned_edits": "",
+        "patches": [{"op": "replace", "path": "/rule", "value": rule}],
+    }
+
+
+def run_tool(store: InMemoryStore, *responses: list) -> tuple[str, ScriptedModel]:
+    model = ScriptedModel(responses=list(responses), prompts=[])
+    state = {
+        "messages": [
+            HumanMessage("Please always add a deadline to my tasks"),
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "UpdateMemory", "args": {"update_type": "instructions"}, "id": "update-1"}],
+            ),
+        ]
+    }
+    result = InstructionsTool(model).run_tool(state, CONFIG, store)
+    return result["messages"][0]["content"], model
+
+
+def rules(store: InMemoryStore) -> dict[str, str]:
+    return {item.key: item.value["rule"] for item in store.search(NAMESPACE, limit=100)}
+
+
+def test_new_rule_is_inserted():
+    store = InMemoryStore()
+
+    run_tool(store, [("Instruction", {"rule": "Always add a deadline"})])
+
+    assert list(rules(store).values()) == ["Always add a deadline"]
+
+
+def test_rules_are_patched_inserted_and_removed():
+    store = InMemoryStore()
+    store.put(NAMESPACE, "deadline", {"rule": "Add a deadline"})
+    store.put(NAMESPACE, "emoji", {"rule": "Use emojis"})
+
+    message, _ = run_tool(store, [
+        patch("deadline", "Always add a deadline"),
+        ("RemoveDoc", {"json_doc_id": "emoji"}),
+        ("Instruction", {"rule": "Keep task names short"}),
+    ])
+
+    stored = rules(store)
+    assert stored.pop("deadline") == "Always add a deadline"
+    assert list(stored.values()) == ["Keep task names short"]
+    assert "Document emoji removed" in message
+
+
+def test_unchanged_rule_is_not_written():
+    store = InMemoryStore()
+    store.put(NAMESPACE, "deadline", {"rule": "Add a deadline"})
+    updated_at = store.get(NAMESPACE, "deadline").updated_at
+
+    run_tool(store, [patch("deadline", "Add a deadline")])
+
+    assert store.get(NAMESPACE, "deadline").updated_at == updated_at
+    assert rules(store) == {"deadline": "Add a deadline"}
+
+
+def test_every_rule_is_visible_beyond_the_search_limit():
+    store = InMemoryStore()
+    for i in range(12):
+        store.put(NAMESPACE, f"rule-{i}", {"rule": f"Rule {i}"})
+
+    _, model = run_tool(store, [patch("rule-11", "Rule eleven")])
+
+    prompt = "\n".join(str(message.content) for message in model.prompts[0])
+    assert all(f"rule-{i}" in prompt for i in range(12))
+    assert rules(store)["rule-11"] == "Rule eleven"
+    assert MasterAgent(model)._get_instructions_memory(USER_ID, store).count("- Rule") == 12
+
+
+def test_legacy_instructions_are_migrated():
+    store = InMemoryStore()
+    store.put(NAMESPACE, "text", {"memory": "Add a deadline"})
+    store.put(NAMESPACE, "list", {"memory": ["Use emojis"]})
+    store.put(NAMESPACE, "empty", {"memory": None})
+
+    run_tool(store, [patch("text", "Always add a deadline")])
+
+    assert rules(store) == {"text": "Always add a deadline", "list": '["Use emojis"]'}
+
+
+def test_legacy_instructions_are_shown_to_the_agent():
+    store = InMemoryStore()
+    store.put(NAMESPACE, "text", {"memory": "Add a deadline"})
+    store.put(NAMESPACE, "empty", {"memory": None})
+
+    assert MasterAgent(ScriptedModel())._get_instructions_memory(USER_ID, store) == "- Add a deadline"
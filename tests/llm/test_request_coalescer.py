@@ -0,0 +1,196 @@
+import threading
+import time
+from typing import Any, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import BaseModel
+
+from llm.request_coalescer import CoalescingChatModel, RequestCoalescer, TokenBucket
+
+
+class Weather(BaseModel):
+    """Get the weather of a city"""
+    city: str
+
+
+class Time(BaseModel):
+    """Get the time of a city"""
+    city: str
+
+
+class FakeProvider(BaseChatModel):
+    """Local provider echoing the last message and recording its batch calls."""
+    batches: list = []
+    fail_on: Optional[str] = None
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-provider"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[tool.__name__ for tool in tools], **kwargs)
+
+    def batch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        self.batches.append((len(inputs), kwargs))
+        return super().batch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.delay)
+        content = messages[-1].content
+        if content == self.fail_on:
+            raise RuntimeError(f"provider error for {content}")
+        message = AIMessage(
+            content=f"{content} {kwargs.get('tools', [])} {kwargs.get('tool_choice')}",
+            usage_metadata={"input_tokens": 1, "output_tokens": 1, "total_tokens": 2},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def run_concurrently(func, args_list):
+    results = [None] * len(args_list)
+
+    def run(i, args):
+        try:
+            results[i] = func(*args)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_responses_are_routed_back_to_their_callers():
+    provider = FakeProvider(batches=[])
+    llm = CoalescingChatModel(coalescer=RequestCoalescer(provider, max_wait_ms=50))
+
+    results = run_concurrently(
+        lambda i: llm.invoke([HumanMessage(f"request {i}")]).content,
+        [(i,) for i in range(20)],
+    )
+
+    assert [result.split()[1] for result in results] == [str(i) for i in range(20)]
+    # Requests were coalesced into fewer provider calls
+    assert len(provider.batches) < 20
+    assert sum(size for size, _ in provider.batches) == 20
+
+
+def test_requests_are_grouped_by_bound_tools():
+    provider = FakeProvider(batches=[])
+    llm = CoalescingChatModel(coalescer=RequestCoalescer(provider, max_wait_ms=100))
+    bound = {
+        "weather": llm.bind_tools([Weather], tool_choice="Weather"),
+        "time": llm.bind_tools([Time], tool_choice="Time"),
+        "any": llm.bind_tools([Weather]),
+    }
+
+    results = run_concurrently(
+        lambda name, i: bound[name].invoke([HumanMessage(f"{name}-{i}")]).content,
+        [(name, i) for name in bound for i in range(3)],
+    )
+
+    assert results[0] == "weather-0 ['Weather'] Weather"
+    assert results[3] == "time-0 ['Time'] Time"
+    assert results[6] == "any-0 ['Weather'] None"
+    # One provider call per distinct set of bound options
+    dispatched = [(kwargs["tools"], kwargs.get("tool_choice")) for _, kwargs in provider.batches]
+    assert sorted(dispatched, key=repr) == sorted(
+        [(["Weather"], "Weather"), (["Time"], "Time"), (["Weather"], None)], key=repr
+    )
+    assert all(size == 3 for size, _ in provider.batches)
+
+
+def test_tools_with_the_same_schema_are_grouped():
+    def make_tool():
+        # Like trustcall's RemoveDoc, a new class on every extraction
+        class Weather(BaseModel):
+            """Get the weather of a city"""
+            city: str
+        return Weather
+
+    provider = FakeProvider(batches=[])
+    llm = CoalescingChatModel(coalescer=RequestCoalescer(provider, max_wait_ms=100))
+
+    run_concurrently(
+        lambda i: llm.bind_tools([make_tool()]).invoke([HumanMessage(f"request {i}")]),
+        [(i,) for i in range(4)],
+    )
+
+    assert [size for size, _ in provider.batches] == [4]
+
+
+def test_groups_with_different_options_run_concurrently():
+    provider = FakeProvider(batches=[], delay=0.5)
+    llm = CoalescingChatModel(coalescer=RequestCoalescer(provider, max_wait_ms=50))
+
+    start = time.monotonic()
+    run_concurrently(
+        lambda i: llm.bind(tool_choice=f"tool-{i}").invoke([HumanMessage(f"request {i}")]),
+        [(i,) for i in range(6)],
+    )
+
+    assert len(provider.batches) == 6
+    assert time.monotonic() - start < 0.9
+
+
+def test_provider_errors_only_fail_their_own_request():
+    provider = FakeProvider(batches=[], fail_on="bad")
+    llm = CoalescingChatModel(coalescer=RequestCoalescer(provider, max_wait_ms=50))
+
+    results = run_concurrently(
+        lambda content: llm.invoke([HumanMessage(content)]),
+        [("good",), ("bad",), ("also good",)],
+    )
+
+    assert isinstance(results[1], RuntimeError)
+    assert results[0].content.startswith("good")
+    assert results[2].content.startswith("also good")
+
+
+def test_token_bucket_blocks_until_refilled():
+    bucket = TokenBucket(tokens_per_second=100, capacity=100)
+
+    start = time.monotonic()
+    bucket.acquire(100)
+    assert time.monotonic() - start < 0.1
+
+    bucket.acquire(50)
+    assert time.monotonic() - start == pytest.approx(0.5, abs=0.15)
+
+
+def test_token_bucket_charges_underestimated_usage():
+    bucket = TokenBucket(tokens_per_second=100, capacity=100)
+    bucket.acquire(10)
+    # The request used 60 tokens more than estimated
+    bucket.adjust(60)
+
+    start = time.monotonic()
+    bucket.acquire(50)
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+
+
+def test_rate_limit_counts_tools_and_completion_tokens():
+    provider = FakeProvider(batches=[])
+    coalescer = RequestCoalescer(provider, tokens_per_second=1000, expected_output_tokens=100)
+    messages = [HumanMessage("hi")]
+
+    plain = coalescer._estimate_tokens({}, messages)
+    with_tools = coalescer._estimate_tokens({"tools": [Weather]}, messages)
+    with_max_tokens = coalescer._estimate_tokens({"max_tokens": 10}, messages)
+
+    assert plain > 100
+    assert with_tools > plain
+    assert with_max_tokens == plain - 90
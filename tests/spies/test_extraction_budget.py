@@ -0,0 +1,43 @@
+from langchain_core.runnables import RunnableLambda
+
+from spies.extraction_budget import ExtractionBudget
+from spies.extraction_metrics import extraction_metrics
+
+
+def extraction(attempts: int) -> dict:
+    return {"messages": [], "responses": ["doc"], "response_metadata": [{}], "attempts": attempts}
+
+
+def test_repair_rounds_come_from_trustcall_attempts():
+    before = extraction_metrics.summary().get("Rounds", {}).get("repair_rounds", 0)
+    budget = ExtractionBudget(max_repair_rounds=1)
+
+    result = budget.invoke(RunnableLambda(lambda inputs: extraction(attempts=2)), {}, "Rounds")
+
+    assert result["responses"] == ["doc"]
+    assert budget.repair_rounds == 1
+    assert extraction_metrics.summary()["Rounds"]["repair_rounds"] == before + 1
+
+
+def test_max_attempts_follows_the_repair_rounds():
+    budget = ExtractionBudget(max_repair_rounds=1)
+    seen = []
+
+    budget.invoke(
+        RunnableLambda(lambda inputs, config: seen.append(config["configurable"]["max_attempts"]) or extraction(1)),
+        {},
+        "Attempts",
+    )
+
+    assert seen == [2]
+
+
+def test_result_is_dropped_at_the_deadline():
+    budget = ExtractionBudget(deadline_s=0)
+    # Trustcall swallowed the deadline error raised by the budget and returned normally
+    budget.deadline_exceeded = True
+
+    result = budget.invoke(RunnableLambda(lambda inputs: extraction(attempts=3)), {}, "Deadline")
+
+    assert result == budget.skipped_result()
+    assert extraction_metrics.summary()["Deadline"]["deadline_exceeded"] >= 1
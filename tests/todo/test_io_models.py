@@ -0,0 +1,31 @@
+import pytest
+from pydantic import ValidationError
+
+from todo.io_models import ToDo
+
+
+@pytest.mark.parametrize(
+    "time_to_complete, minutes",
+    [("30 minutes", 30), ("1.5 hours", 90), ("2h", 120), ("45", 45), (30.0, 30), (29.6, 30)],
+)
+def test_time_to_complete_is_converted_to_minutes(time_to_complete, minutes):
+    todo = ToDo(task="Book flights", time_to_complete=time_to_complete)
+    assert todo.time_to_complete == minutes
+
+
+@pytest.mark.parametrize("time_to_complete", ["about an hour", "3 days"])
+def test_unparseable_time_to_complete_is_left_for_trustcall(time_to_complete):
+    with pytest.raises(ValidationError) as error:
+        ToDo(task="Book flights", time_to_complete=time_to_complete)
+    assert error.value.errors()[0]["loc"] == ("time_to_complete",)
+
+
+def test_single_solution_becomes_a_list():
+    todo = ToDo(task="Book flights", solutions="Compare prices on Kayak")
+    assert todo.solutions == ["Compare prices on Kayak"]
+
+
+@pytest.mark.parametrize("data", [{}, {"solutions": []}, {"solutions": None}, {"solutions": ""}])
+def test_missing_or_empty_solutions_fall_back_to_the_default(data):
+    todo = ToDo(task="Book flights", **data)
+    assert todo.solutions == []